@@ -8,7 +8,15 @@ Argument parsing and configuration functions to be used by programs
 
 import argparse
 import json
-import re
+import operator
+import sys
+
+# Optional, a faster JSON parser (its errors subclass json.JSONDecodeError)
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 
 # defaults that should be overridden after import
@@ -22,6 +30,9 @@ program_description = 'Program'
 # programs using this module should add to this
 arg_list = []
 
+# the parser built from arg_list, see build_parser()
+_parser_cache = None
+
 
 class nestedAction(argparse.Action):
     """
@@ -40,6 +51,16 @@ class nestedAction(argparse.Action):
         setattr(last_level, dest, values)
 
 
+# types supported by directConfig, mapped to their conversion functions
+inject_types = {
+    'bool' : bool,
+    'int' : int,
+    'float' : float,
+    'complex' : complex,
+    'bytes' : lambda value: bytes(value, 'utf-8'),
+}
+
+
 class directConfig(argparse.Action):
     """
     Custom argparse action that parses the argument value to place
@@ -50,30 +71,60 @@ class directConfig(argparse.Action):
     """
     def __call__(self, parser, namespace, values, option_string=None,
       separator='.'):
-        try:
-            place,content = values.split('=')
-            match = re.search('^:(.+):(.+)', content)
-            # seems like there should be a standard way to do this
-            if match:
-                data_type = match.group(1)
-                types = [ 'bool', 'int', 'float', 'complex', 'bytes' ]
-                if data_type in types:
-                    data = getattr(__builtins__, data_type)(match.group(2))
-                else:
-                    raise ValueError
-            else:
-                data = content
-            levels = list(place.split(separator))
-            dest = levels.pop()
-            last_level = namespace
-            for level in levels: 
-                next_level = getattr(last_level, level, argparse.Namespace())
-                setattr(last_level, level, next_level)
-                last_level = next_level
-            setattr(last_level, dest, data)
-        except:
-            # if one of the splits failed, we don't need the data
-            pass
+        inject_config(namespace, values, separator)
+
+
+def inject_config(namespace, values, separator='.'):
+    """
+    Place a <key>=<data> setting in a (nested) namespace, see directConfig
+    Malformed settings are ignored
+    """
+    try:
+        place,content = values.split('=')
+        data = content
+        if content.startswith(':'):
+            end = content.find(':', 1)
+            if end > 1 and end < len(content) - 1:
+                data_type = content[1:end]
+                data = inject_types[data_type](content[end+1:])
+        levels = list(place.split(separator))
+        dest = levels.pop()
+        last_level = namespace
+        for level in levels: 
+            next_level = getattr(last_level, level, argparse.Namespace())
+            setattr(last_level, level, next_level)
+            last_level = next_level
+        setattr(last_level, dest, data)
+    except (ValueError, KeyError, AttributeError):
+        # if one of the splits or the conversion failed, the type is
+        #   unknown, or the key conflicts with an existing (non-nested)
+        #   setting, we don't need the data
+        pass
+
+
+def parse_common_arguments(args):
+    """
+    Parse arguments without building the full parser, for the common case
+    where only config files and injected settings are given
+    Returns a namespace like the parser's, or None if anything else (or
+    anything unusual) is found and the full parser is needed
+    """
+    namespace = argparse.Namespace()
+    remaining = iter(args)
+    for arg in remaining:
+        value = next(remaining, None)
+        if value is None or value.startswith('-'):
+            return None
+        if arg in ('--configfile', '-c'):
+            # same destination as the --configfile entry in arg_list
+            if not hasattr(namespace, 'config_files'):
+                namespace.config_files = []
+            namespace.config_files.append(value)
+        elif arg in ('--inject', '-i'):
+            inject_config(namespace, value)
+        else:
+            return None
+    return namespace
 
 
 def collect_arguments(config):
@@ -82,33 +133,50 @@ def collect_arguments(config):
     This also handles 'respond and exit' arguments
     """
     def _recursive_vars(ns):
-        """Apply vars() recursively to nested namespaces"""
-        vars_this_level = vars(ns)
-        for var in vars_this_level.keys():
-            # big assumption about types here
-            if type(vars_this_level[var]) == type(ns):
-                vars_this_level[var] = _recursive_vars(vars_this_level[var])
-        return vars_this_level
-
-    arg_parser = argparse.ArgumentParser(prog=program_name,
-        description=program_description,
-        argument_default=argparse.SUPPRESS)
-    for arg in arg_list:
-        # fix up program version since arg_list is built at module-import time
-        if arg[1]['action'] == 'version':
-            arg[1]['version'] = "%%(prog)s version %s" % program_version
-        arg_parser.add_argument(*arg[0], **arg[1])
-    config['from_arguments'] = _recursive_vars(arg_parser.parse_args())
+        """
+        Convert nested namespaces into nested dicts
+        Builds new dicts rather than modifying the namespaces' own
+        """
+        top_level = {}
+        to_convert = [ (ns, top_level) ]
+        while to_convert:
+            namespace, this_level = to_convert.pop()
+            for var, value in vars(namespace).items():
+                if isinstance(value, argparse.Namespace):
+                    this_level[var] = {}
+                    to_convert.append((value, this_level[var]))
+                else:
+                    this_level[var] = value
+        return top_level
+
+    arguments = parse_common_arguments(sys.argv[1:])
+    if arguments is None:
+        arguments = build_parser().parse_args()
+    config['from_arguments'] = _recursive_vars(arguments)
+
+
+def build_parser():
+    """
+    Build the argument parser from arg_list on first use, and return it
+    The parser is cached, so arg_list should be complete before this is
+    called
+    """
+    global _parser_cache
+    if _parser_cache is None:
+        arg_parser = argparse.ArgumentParser(prog=program_name,
+            description=program_description,
+            argument_default=argparse.SUPPRESS)
+        # added here, as program_version is set after this module is loaded
+        arg_parser.add_argument('--version', '-v', action='version',
+            version="%%(prog)s version %s" % program_version)
+        for arg in arg_list:
+            arg_parser.add_argument(*arg[0], **arg[1])
+        _parser_cache = arg_parser
+    return _parser_cache
 
 
 # arguments handled by collect_arguments()
-# version string here is superceded by collect_arguments()
-arg_list.append(
-    [ [ '--version', '-v' ],
-      { 'action' : 'version',
-        'version' : 'PROGRAM version VERSION'
-      } ]
-)
+# (--version is added by build_parser())
 # No better place for this
 arg_list.append(
     [ [ '--inject', '-i' ],
@@ -122,27 +190,24 @@ arg_list.append(
 def read_config(config):
     """
     Read in configuration files
-    Files are expected to be in standard JSON format (see documentation)
+    Files are expected to be in standard JSON format (see documentation),
+    each containing a single object
     """
     files_to_read = ( config['from_arguments'].get('config_files') or
         [ default_config_file ] )
     data = {}
     for file in files_to_read:
         try:
-            with open(file, mode='r') as f:
-                data_from_file = json.load(f)
-                # consider a dict, or list containing a single dict, valid
-                if type(data_from_file) == dict:
-                    data.update(data_from_file)
-                elif type(data_from_file) == list:
-                    if type(data_from_file[0]) == dict:
-                        data.update(data_from_file[0])
-                else:
-                    raise json.JSONDecodeError
+            with open(file, mode='rb') as f:
+                data_from_file = json_loads(f.read())
+            if not isinstance(data_from_file, dict):
+                raise ValueError("expected top-level JSON object")
+            data.update(data_from_file)
         except OSError as err:
             print("got OSError %s on %s" % (err.strerror, err.filename))
-        except json.JSONDecodeError:
-            print("got JSONDecodeError")
+        except ValueError as err:
+            # JSON decoding errors are ValueErrors as well
+            print("got ValueError %s on %s" % (err, file))
     config['from_files'] = data
 
 # arguments handled by read_config
@@ -157,25 +222,39 @@ arg_list.append(
 )
 
 
-def set_parameter(config, param_section, param_name, param_default):
+# fetches the collected arguments and file contents in one call
+_config_sources = operator.itemgetter('from_arguments', 'from_files')
+
+
+def get_sections(config, section):
+    """
+    Return a section of the collected arguments and of the file contents,
+    as a tuple; a missing or malformed section is returned as an empty dict
+    """
+    return tuple(
+        source[section] if isinstance(source.get(section), dict) else {}
+        for source in _config_sources(config) )
+
+
+def set_parameter(config, param_section, param_name, param_default,
+  args_section=None, files_section=None):
     """
     Set the value of a configuration parameter from arguments, configuration
     files, or a default, in that order
+    Callers setting many parameters should look up the sections once with
+    get_sections() and pass them in
+    A callable default is only called if the default is needed
     """
-    try:
-        value_from_args = config['from_arguments'][param_section][param_name]
-    except:
-        value_from_args = None
-    try:
-        value_from_files = config['from_files'][param_section][param_name]
-    except:
-        value_from_files = None
+    if args_section is None or files_section is None:
+        args_section, files_section = get_sections(config, param_section)
+    value_from_args = args_section.get(param_name)
+    value_from_files = files_section.get(param_name)
     if value_from_args is not None:
         param_value = value_from_args
     elif value_from_files is not None:
         param_value = value_from_files
+    elif callable(param_default):
+        param_value = param_default()
     else:
         param_value = param_default
     config[param_section][param_name] = param_value
-
-
@@ -45,6 +45,22 @@ def initialize_config(config):
     config_helpers.read_config(config)
 
 
+# external log levels (the index) mapped to logging levels
+log_level_mapping = ( logging.NOTSET,
+                      logging.WARNING,
+                      logging.INFO,
+                      logging.DEBUG )
+
+# parameters set by configure_logging, with their defaults
+log_parameters = ( ('log_type', 'stderr'),
+                   ('log_level', 2),
+                   ('log_file', ''),
+                   ('log_facility', 'mail'),
+                   ('log_syslog_dest', '/dev/log'),
+                   ('config', {})
+)
+
+
 def configure_logging(config):
     """
     Turn arguments and config file contents into logging configuration
@@ -52,10 +68,6 @@ def configure_logging(config):
     """
     def _transform_log_level():
         """transform the external log level into a logger logging level"""
-        log_level_mapping = [ logging.NOTSET,
-                              logging.WARNING,
-                              logging.INFO,
-                              logging.DEBUG ]
         config['log']['log_level'] = \
             log_level_mapping[int(config['log']['log_level'])]
 
@@ -66,15 +78,11 @@ def configure_logging(config):
             config['log']['log_syslog_dest'] = (hostname, int(port))
 
     config['log'] = {}
-    parameters = [ ('log_type', 'stderr'),
-                   ('log_level', 2),
-                   ('log_file', ''),
-                   ('log_facility', 'mail'),
-                   ('log_syslog_dest', '/dev/log'),
-                   ('config', {})
-    ]
-    for param in parameters:
-        config_helpers.set_parameter(config, 'log', *param)
+    args_section, files_section = config_helpers.get_sections(config,
+        'log')
+    for param in log_parameters:
+        config_helpers.set_parameter(config, 'log', *param,
+            args_section, files_section)
     _transform_log_level()
     _transform_syslog_dest()
 
@@ -124,35 +132,50 @@ config_helpers.arg_list.append(
 )
 
 
+# parameters set by configure_service, with their defaults
+# gethostname() is only called if no hostname is configured
+service_parameters = ( ('grey_hostname', socket.gethostname),
+                       ('grey_delay', 300),
+                       ('ipv4_mask', 24),
+                       ('ipv6_mask', 48),
+                       ('grey_action', 'DEFER_IF_PERMIT'),
+                       ('grey_text',
+                           'Greylisted, please retry in {wait} seconds'),
+                       ('grey_max_age', 3024000),
+                       ('maintenance_interval', 3600),
+                       ('hash_grey_db', True),
+                       ('grey_db_hash', 'sha1'),
+                       ('grey_retry_window', 172800),
+                       ('grey_smtp_header',
+                           "X-Greylist: delayed {delay} seconds at "
+                           "{hostname}; {date}" ),
+                       ('grey_db', grey_db_default),
+                       ('grey_db_key_prefix', ''),
+                       ('grey_db_cache_size', 0),
+                       ('grey_db_cache_ttl', 30),
+                       ('grey_db_maintenance_disable', False),
+                       ('awl_client_count', 0),
+                       ('awl_db', awl_db_default),
+                       ('awl_db_key_prefix', ''),
+                       ('awl_db_cache_size', 0),
+                       ('awl_db_cache_ttl', 30),
+                       ('awl_db_maintenance_disable', False),
+                       ('wl_sources', wl_sources_default),
+                       ('allow_wl_regex', False)
+)
+
+
 def configure_service(config):
     """
     Turn arguments and config file contents into service configuration
     Returns the completed service configuration as a dict
     """
     config['service'] = {}
-    parameters = [ ('grey_hostname', socket.gethostname()),
-                   ('grey_delay', 300),
-                   ('ipv4_mask', 24),
-                   ('ipv6_mask', 48),
-                   ('grey_action', 'DEFER_IF_PERMIT'),
-                   ('grey_text', 'Greylisted, please retry in {wait} seconds'),
-                   ('grey_max_age', 3024000),
-                   ('maintenance_interval', 3600),
-                   ('hash_grey_db', True),
-                   ('grey_retry_window', 172800),
-                   ('grey_smtp_header',
-                       "X-Greylist: delayed {delay} seconds at {hostname}; "
-                       "{date}" ),
-                   ('grey_db', grey_db_default),
-                   ('grey_db_maintenance_disable', False),
-                   ('awl_client_count', 0),
-                   ('awl_db', awl_db_default),
-                   ('awl_db_maintenance_disable', False),
-                   ('wl_sources', wl_sources_default),
-                   ('allow_wl_regex', False)
-    ]
-    for param in parameters:
-        config_helpers.set_parameter(config, 'service', *param)
+    args_section, files_section = config_helpers.get_sections(config,
+        'service')
+    for param in service_parameters:
+        config_helpers.set_parameter(config, 'service', *param,
+            args_section, files_section)
 
 # arguments handled by configure_service
 config_helpers.arg_list.append(
@@ -209,6 +232,23 @@ config_helpers.arg_list.append(
 )
 
 
+# parameters set by configure_server, with their defaults
+server_parameters = ( ('socket_type', 'unix'),
+                      ('socket_mode', '0660'),
+                      ('socket_path', socket_path_default),
+                      ('socket_listen_host', 'localhost'),
+                      ('socket_listen_port', 10023),
+                      ('listen_queue_size', 5),
+                      ('reuse_socket', True),
+                      ('daemonize', False),
+                      ('chroot', False),
+                      ('chroot_dir', ''),
+                      ('user', 'postgrey'),
+                      ('group', 'postgrey'),
+                      ('pid_file_path', pid_file_path_default)
+)
+
+
 def configure_server(config):
     """
     Turn arguments and config file contents into server configuration
@@ -228,22 +268,11 @@ def configure_server(config):
                 config['server']['group'])[2]
 
     config['server'] = {}
-    parameters = [ ('socket_type', 'unix'),
-                   ('socket_mode', '0660'),
-                   ('socket_path', socket_path_default),
-                   ('socket_listen_host', 'localhost'),
-                   ('socket_listen_port', 10023),
-                   ('listen_queue_size', 5),
-                   ('reuse_socket', True),
-                   ('daemonize', False),
-                   ('chroot', False),
-                   ('chroot_dir', ''),
-                   ('user', 'postgrey'),
-                   ('group', 'postgrey'),
-                   ('pid_file_path', pid_file_path_default)
-    ]
-    for param in parameters:
-        config_helpers.set_parameter(config, 'server', *param)
+    args_section, files_section = config_helpers.get_sections(config,
+        'server')
+    for param in server_parameters:
+        config_helpers.set_parameter(config, 'server', *param,
+            args_section, files_section)
     _transform_user_and_group()
 
 # arguments handled by configure_server
@@ -0,0 +1,25 @@
+
+"""
+Database access implementations usable as greylisting databases
+Backend classes are loaded on first access, so that only the backend
+selected by the configuration (and its dependencies) gets imported
+"""
+
+from tprt_db.greydb import greyDB
+
+__all__ = ['greyDB', 'gdbmDB', 'redisDB']
+
+
+# maps exported class names to the modules providing them
+_backends = {
+    'gdbmDB' : 'tprt_db.gdbm',
+    'redisDB' : 'tprt_db.redis',
+}
+
+
+def __getattr__(name):
+    """Import a backend module the first time one of its classes is used"""
+    if name in _backends:
+        import importlib
+        return getattr(importlib.import_module(_backends[name]), name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
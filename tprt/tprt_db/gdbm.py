@@ -1,29 +1,35 @@
 
 from tprt_db.greydb import greyDB
-import dbm.gnu
 import logging
 import threading
 
 
+# set up once, rather than adding another handler for every instance
+if not logging.getLogger(__name__).handlers:
+    logging.getLogger(__name__).addHandler(logging.NullHandler())
+
 
 class gdbmDB(greyDB):
     """
     This class uses dbm.gnu to save and restore a database as needed
-    Keys and values are expected to be strings
+    Keys and values are expected to be strings; tprtd keys are either
+    hex digests (hash_grey_db) or '/'-joined request fields
     """
 
+    __slots__ = ('_db', '_lock')
+
     def __init__(self, db_file):
         """Open or create the DB file, and create the write lock"""
-        logging.getLogger(__name__).addHandler(logging.NullHandler())
+        # imported here so that loading this module stays cheap
+        import dbm.gnu
         self._db =  dbm.gnu.open(db_file, 'cf', 0o660)
         self._lock = threading.Lock()
         logging.debug("opened gdbm file %s", db_file)
 
     def update(self, key, value):
         """Write a key/value pair, with locking"""
-        self._lock.acquire()
-        self._db[key] = value
-        self._lock.release()
+        with self._lock:
+            self._db[key] = value
         logging.debug("inserted key %s with value %s into db", key, value)
 
     def get(self, key):
@@ -39,22 +45,35 @@ class gdbmDB(greyDB):
         Used on existing keys only, may raise an exception if the key
         is not found.  The caller should call save() after finishing work
         """
-        self._lock.acquire()
-        del self._db[key]
-        self._lock.release()
+        with self._lock:
+            del self._db[key]
         logging.debug("removed key %s from db", key)
 
     def save(self):
         """Write the database to disk"""
         logging.debug("sychronizing db")
-        self._db.sync()
+        with self._lock:
+            self._db.sync()
         
     def apply(self, func):
         """
         Loop over entries, passing keys and values to func(), which
         should take a key/value pair and return something or None
         'None' results from func() are filtered out
+        The keys are collected under the lock and results are generated
+        from that list, so the database may be changed during the loop
         """
         logging.debug("applying function %s to db", str(func))
-        return [ y for y in [ func(x, self._db[x]) for x in self._db.keys() ] if y ]
+        # a gdbm traversal is not safe against concurrent writes, so only
+        #   the key listing is done with the lock held
+        with self._lock:
+            keys = self._db.keys()
+        for key in keys:
+            # the key may have been removed since it was listed, get()
+            #   then returns None
+            value = self._db.get(key)
+            if value is not None:
+                result = func(key, value)
+                if result is not None:
+                    yield result
 
@@ -4,6 +4,9 @@ class greyDB:
     This class is a superclass of all database access implementations that
     support the methods needed to be used as a greylisting database
     """
+    # subclasses should also define __slots__, listing their attributes
+    __slots__ = ()
+
     def __init__(self, db_file):
         """Open or create the DB file, and create the write lock"""
         raise NotImplementedError
@@ -33,6 +36,7 @@ class greyDB:
         Loop over entries, passing keys and values to func(), which
         should take a key/value pair and return something or None
         'None' results from func() are filtered out
+        Returns an iterator over the results
         """
         raise NotImplementedError
 
@@ -1,40 +1,110 @@
 
 from tprt_db.greydb import greyDB
+from collections import OrderedDict
 import logging
 import re
-import redis
+import threading
+import time
 
 
+# set up once, rather than adding another handler for every instance
+if not logging.getLogger(__name__).handlers:
+    logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+
+# matches the password in the userinfo part of a URL, up to the last '@'
+#   before the path
+_url_password_re = re.compile(r'(//[^:/@]*:)[^/]*@')
+
+# characters with a special meaning in redis glob-style patterns
+_glob_special_re = re.compile(rb'[\\*?\[\]]')
+
+
+def _to_bytes(data):
+    """Encode strings the same way the redis client does"""
+    if isinstance(data, bytes):
+        return data
+    return bytes(data, 'utf-8')
+
 
 class redisDB(greyDB):
     """
     This class fronts a redis database for greylist entries
     It may work for other uses as well
     Keys and values are expected to be strings
+    An optional key prefix is added to all keys, so the database can be
+    shared with other users; apply() only visits keys with the prefix
+    Values read or written can be kept in a small in-process LRU cache
+    for cache_ttl seconds; changes made by other clients of the same
+    database may then be seen that much later, so the cache is off by
+    default and should stay off for shared databases
     """
 
+    __slots__ = ('_db', '_key_prefix', '_key_match', '_cache', '_cache_lock',
+        '_cache_size', '_cache_ttl', '_cache_generation')
+
     # This currently assumes that redis does sufficient locking
 
-    def __init__(self, url):
-        """Open a connection to a specified redis instance"""
-        logging.getLogger(__name__).addHandler(logging.NullHandler())
-        sanitized_url = re.sub('/:.*@','/:password@',url)
+    # number of values fetched per round trip by apply()
+    _apply_batch_size = 500
+
+    def __init__(self, url, key_prefix='', cache_size=0, cache_ttl=30):
+        """
+        Open a connection to a specified redis instance, and set up the
+        value cache (disabled with the default cache_size of 0)
+        """
+        # imported here so that loading this module stays cheap
+        import redis
+        sanitized_url = _url_password_re.sub(r'\1password@', url)
         self._db = redis.Redis.from_url(url)
+        self._key_prefix = _to_bytes(key_prefix)
+        # SCAN uses glob-style patterns, so escape the prefix for matching
+        self._key_match = _glob_special_re.sub(rb'\\\g<0>',
+            self._key_prefix) + b'*'
+        # maps keys to (expiry time, value), least recently used first
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_size = cache_size
+        self._cache_ttl = cache_ttl
+        # changed by every write, so that get() does not cache a value
+        #   read before a concurrent update() or delete()
+        self._cache_generation = 0
         logging.info('opened redis connection via url %s', sanitized_url)
 
     def update(self, key, value):
         """Write a key/value pair to the redis instance"""
-        result = self._db.set(key, value)
+        result = self._db.set(self._prefixed(key), value)
         if result:
+            if self._cache_size > 0:
+                self._cache_store(key, _to_bytes(value))
             logging.debug("inserted key %s with value %s into database",
                 key, value )
         else:
+            if self._cache_size > 0:
+                self._cache_remove(key)
             logging.warning("failed to insert key %s with value %s "
                "into database", key, value )
 
     def get(self, key):
-        """Look up a value in the database, return None if not found"""
-        return self._db.get(key)
+        """
+        Look up a value in the cache or the database, return None if not
+        found (lookups that find nothing are not cached)
+        """
+        if self._cache_size <= 0:
+            return self._db.get(self._prefixed(key))
+        cache_key = _to_bytes(key)
+        with self._cache_lock:
+            entry = self._cache.get(cache_key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._cache.move_to_end(cache_key)
+                    return entry[1]
+                del self._cache[cache_key]
+            generation = self._cache_generation
+        value = self._db.get(self._prefixed(key))
+        if value is not None:
+            self._cache_store(key, value, generation)
+        return value
 
     def delete(self,key):
         """
@@ -42,7 +112,11 @@ class redisDB(greyDB):
         Used on existing keys only, may raise an exception if the key
         is not found.  The caller should call save() after finishing work
         """
-        self._db.delete(key)
+        self._db.delete(self._prefixed(key))
+        # after the delete: a concurrent get() that read the old value can
+        #   no longer cache it, as this changes the cache generation
+        if self._cache_size > 0:
+            self._cache_remove(key)
         logging.debug("removed key %s from db", key)
 
     def save(self):
@@ -55,7 +129,64 @@ class redisDB(greyDB):
         Loop over entries, passing keys and values to func(), which
         should take a key/value pair and return something or None
         'None' results from func() are filtered out
+        Results are generated as the database is scanned, values are
+        fetched in batches.  Keys are passed without the key prefix
         """
         logging.debug("applying function %s to db", str(func))
-        return [ y for y in [ func(x, self._db.get(x)) for x in self._db.scan_iter() ] if y ]
+        batch = []
+        for key in self._db.scan_iter(match=self._key_match,
+          count=1000):
+            batch.append(key)
+            if len(batch) >= self._apply_batch_size:
+                yield from self._apply_batch(func, batch)
+                batch = []
+        if batch:
+            yield from self._apply_batch(func, batch)
+
+    def _cache_store(self, key, value, generation=None):
+        """
+        Add or refresh a cache entry, dropping the oldest if needed
+        Without a generation this is a write; with one (from get()), the
+        value is only cached if nothing was written since that generation
+        """
+        cache_key = _to_bytes(key)
+        with self._cache_lock:
+            if generation is None:
+                self._cache_generation += 1
+            elif generation != self._cache_generation:
+                return
+            self._cache[cache_key] = (time.monotonic() + self._cache_ttl,
+                value)
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_remove(self, key):
+        """Drop a cache entry, if there is one"""
+        with self._cache_lock:
+            self._cache_generation += 1
+            self._cache.pop(_to_bytes(key), None)
+
+    def _prefixed(self, key):
+        """Return the key as stored in redis, with the key prefix"""
+        if not self._key_prefix:
+            return key
+        return self._key_prefix + _to_bytes(key)
+
+    def _apply_batch(self, func, keys):
+        """
+        Fetch the values for a batch of keys in one round trip, and pass
+        each key/value pair to func()
+        """
+        pipe = self._db.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(key)
+        prefix_length = len(self._key_prefix)
+        for key, value in zip(keys, pipe.execute()):
+            # the key may have been removed since it was scanned
+            if value is None:
+                continue
+            result = func(key[prefix_length:], value)
+            if result is not None:
+                yield result
 
@@ -53,6 +53,10 @@ with open(config.wl_source, mode='r') as f:
 
 conn = redis.Redis.from_url(config.redis_db)
 
+# commands are queued in a pipeline and sent in batches of this size
+pipeline_batch_size = 1000
+pipe = conn.pipeline(transaction=False)
+
 for (key, value) in data_from_file.items():
     for entry in value:  # expect a list of dicts
         try:
@@ -60,8 +64,11 @@ for (key, value) in data_from_file.items():
             del entry['name']
         except KeyError:
             name = str(uuid.uuid4())
-        for (ekey, evalue) in entry.items():
-            conn.hset(name, ekey, evalue)
-        conn.rpush(key, name)
-    conn.rpush('whitelists', key)
+        if entry:
+            pipe.hset(name, mapping=entry)
+        pipe.rpush(key, name)
+        if len(pipe) >= pipeline_batch_size:
+            pipe.execute()
+    pipe.rpush('whitelists', key)
+pipe.execute()
 